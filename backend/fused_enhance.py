@@ -0,0 +1,270 @@
+import numpy as np
+from numba import njit, prange
+from typing import Tuple
+
+# sRGB -> linear lookup for 8-bit channels, shared by every call
+_SRGB_TO_LINEAR = np.array(
+    [c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4 for c in np.arange(256) / 255.0],
+    dtype=np.float32
+)
+
+# D65 white point used by OpenCV's Lab conversion
+_XN = np.float32(0.950456)
+_ZN = np.float32(1.088754)
+
+
+@njit(inline='always')
+def _lab_f(t: float) -> float:
+    if t > 0.008856:
+        return np.cbrt(t)
+    return 7.787 * t + 16.0 / 116.0
+
+
+@njit(inline='always')
+def _lab_f_inv(f: float) -> float:
+    t = f * f * f
+    if t > 0.008856:
+        return t
+    return (f - 16.0 / 116.0) / 7.787
+
+
+@njit(inline='always')
+def _linear_to_srgb8(c: float) -> np.uint8:
+    if c <= 0.0031308:
+        c = 12.92 * c
+    else:
+        c = 1.055 * c ** (1.0 / 2.4) - 0.055
+    c = c * 255.0 + 0.5
+    if c < 0.0:
+        c = 0.0
+    elif c > 255.0:
+        c = 255.0
+    return np.uint8(c)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _bgr_to_lab(bgr: np.ndarray, srgb_to_linear: np.ndarray) -> np.ndarray:
+    """Convert BGR to 8-bit Lab with the same scaling as cv2.COLOR_BGR2LAB"""
+    height, width = bgr.shape[:2]
+    lab = np.empty((height, width, 3), dtype=np.uint8)
+    for y in prange(height):
+        for x in range(width):
+            b = srgb_to_linear[bgr[y, x, 0]]
+            g = srgb_to_linear[bgr[y, x, 1]]
+            r = srgb_to_linear[bgr[y, x, 2]]
+            fx = _lab_f((0.412453 * r + 0.357580 * g + 0.180423 * b) / _XN)
+            fy = _lab_f(0.212671 * r + 0.715160 * g + 0.072169 * b)
+            fz = _lab_f((0.019334 * r + 0.119193 * g + 0.950227 * b) / _ZN)
+            lum = 116.0 * fy - 16.0
+            lab[y, x, 0] = np.uint8(min(max(lum * 255.0 / 100.0 + 0.5, 0.0), 255.0))
+            lab[y, x, 1] = np.uint8(min(max(500.0 * (fx - fy) + 128.5, 0.0), 255.0))
+            lab[y, x, 2] = np.uint8(min(max(200.0 * (fy - fz) + 128.5, 0.0), 255.0))
+    return lab
+
+
+@njit(inline='always')
+def _reflect_101(i: int, n: int) -> int:
+    """Mirror an out-of-range index like cv2.BORDER_REFLECT_101"""
+    # A single row or column has nothing to mirror and would never converge
+    if n == 1:
+        return 0
+    while i >= n:
+        i = 2 * n - 2 - i
+        if i < 0:
+            i = -i
+    return i
+
+
+@njit(parallel=True, cache=True)
+def _clahe_tile_luts(l_channel: np.ndarray, clip_limit: float, grid_h: int, grid_w: int,
+                     tile_h: int, tile_w: int) -> np.ndarray:
+    """Histogram, clip and integrate every tile in parallel, one tile per prange iteration"""
+    height, width = l_channel.shape
+    tile_area = tile_h * tile_w
+    limit = max(int(clip_limit * tile_area / 256), 1)
+    lut_scale = np.float32(255.0 / tile_area)
+    luts = np.empty((grid_h, grid_w, 256), dtype=np.uint8)
+    for t in prange(grid_h * grid_w):
+        ty = t // grid_w
+        tx = t % grid_w
+        hist = np.zeros(256, dtype=np.int32)
+        for y in range(ty * tile_h, (ty + 1) * tile_h):
+            # Rows/cols past the edge come from the mirrored image, as OpenCV pads them
+            sy = _reflect_101(y, height)
+            for x in range(tx * tile_w, (tx + 1) * tile_w):
+                hist[l_channel[sy, _reflect_101(x, width)]] += 1
+
+        # Clip and redistribute the excess evenly, leftovers spread with a fixed step
+        clipped = 0
+        for i in range(256):
+            if hist[i] > limit:
+                clipped += hist[i] - limit
+                hist[i] = limit
+        batch = clipped // 256
+        residual = clipped - batch * 256
+        for i in range(256):
+            hist[i] += batch
+        if residual > 0:
+            step = max(256 // residual, 1)
+            i = 0
+            while i < 256 and residual > 0:
+                hist[i] += 1
+                i += step
+                residual -= 1
+
+        total = 0
+        for i in range(256):
+            total += hist[i]
+            luts[ty, tx, i] = np.uint8(min(np.rint(np.float32(total) * lut_scale), 255.0))
+    return luts
+
+
+def _tile_size(height: int, width: int, grid_h: int, grid_w: int) -> Tuple[int, int]:
+    """Tile height and width as cv2.CLAHE derives them
+
+    When either side does not divide by the grid, OpenCV pads both sides by
+    grid - size % grid, so a side that did divide still grows by a whole
+    grid and its tiles get one row or column taller than size / grid.
+    """
+    if height % grid_h or width % grid_w:
+        height += grid_h - height % grid_h
+        width += grid_w - width % grid_w
+    return height // grid_h, width // grid_w
+
+
+def clahe_tile_luts(l_channel: np.ndarray, clip_limit: float, tile_grid_size: Tuple[int, int]) -> np.ndarray:
+    """Build the per-tile CLAHE lookup tables the same way cv2.CLAHE does
+
+    Returns a (grid_h, grid_w, 256) uint8 table. Tiles reaching past the
+    image are read with BORDER_REFLECT_101, as in OpenCV, without
+    materialising a padded copy.
+    """
+    grid_w, grid_h = tile_grid_size
+    height, width = l_channel.shape
+    tile_h, tile_w = _tile_size(height, width, grid_h, grid_w)
+    return _clahe_tile_luts(np.ascontiguousarray(l_channel), clip_limit, grid_h, grid_w, tile_h, tile_w)
+
+
+def _interpolation_table(size: int, tile_size: int, n_tiles: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Neighbouring tile indices and blend weight for every row or column"""
+    pos = np.arange(size, dtype=np.float32) * np.float32(1.0 / tile_size) - np.float32(0.5)
+    first = np.floor(pos).astype(np.int64)
+    weight = (pos - first).astype(np.float32)
+    return np.maximum(first, 0), np.minimum(first + 1, n_tiles - 1), weight
+
+
+@njit(parallel=True, cache=True)
+def _apply_clahe(lab: np.ndarray, tile_luts: np.ndarray, y1: np.ndarray, y2: np.ndarray, ya: np.ndarray,
+                 x1: np.ndarray, x2: np.ndarray, xa: np.ndarray) -> None:
+    """Replace L in place with the bilinear blend of the four nearest tile LUTs
+
+    Arithmetic is float32 with round-half-even, matching cv2.CLAHE exactly.
+    """
+    height, width = lab.shape[:2]
+    one = np.float32(1.0)
+    for y in prange(height):
+        lut1 = tile_luts[y1[y]]
+        lut2 = tile_luts[y2[y]]
+        wy = ya[y]
+        wy1 = one - wy
+        for x in range(width):
+            v = lab[y, x, 0]
+            wx = xa[x]
+            wx1 = one - wx
+            res = ((np.float32(lut1[x1[x], v]) * wx1 + np.float32(lut1[x2[x], v]) * wx) * wy1
+                   + (np.float32(lut2[x1[x], v]) * wx1 + np.float32(lut2[x2[x], v]) * wx) * wy)
+            lab[y, x, 0] = np.uint8(min(np.rint(res), 255.0))
+
+
+def apply_clahe(lab: np.ndarray, clip_limit: float = 2.0, tile_grid_size: Tuple[int, int] = (8, 8)) -> None:
+    """CLAHE on the L channel of an 8-bit Lab image, in place
+
+    The row and column interpolation tables are computed once per image and
+    shared by every pixel instead of being re-derived inside the loop.
+    """
+    grid_w, grid_h = tile_grid_size
+    height, width = lab.shape[:2]
+    tile_h, tile_w = _tile_size(height, width, grid_h, grid_w)
+    tile_luts = clahe_tile_luts(lab[:, :, 0], clip_limit, tile_grid_size)
+    y1, y2, ya = _interpolation_table(height, tile_h, grid_h)
+    x1, x2, xa = _interpolation_table(width, tile_w, grid_w)
+    _apply_clahe(lab, tile_luts, y1, y2, ya, x1, x2, xa)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _bilateral_lab_to_bgr(padded: np.ndarray, radius: int, offsets: np.ndarray, space_weight: np.ndarray,
+                          color_weight: np.ndarray) -> np.ndarray:
+    """Bilateral-filter Lab and convert each filtered pixel straight back to BGR"""
+    height = padded.shape[0] - 2 * radius
+    width = padded.shape[1] - 2 * radius
+    bgr = np.empty((height, width, 3), dtype=np.uint8)
+    for y in prange(height):
+        for x in range(width):
+            cy = y + radius
+            cx = x + radius
+            l0 = np.int32(padded[cy, cx, 0])
+            a0 = np.int32(padded[cy, cx, 1])
+            b0 = np.int32(padded[cy, cx, 2])
+            sum_l = 0.0
+            sum_a = 0.0
+            sum_b = 0.0
+            wsum = 0.0
+            for k in range(offsets.shape[0]):
+                yy = cy + offsets[k, 0]
+                xx = cx + offsets[k, 1]
+                l1 = np.int32(padded[yy, xx, 0])
+                a1 = np.int32(padded[yy, xx, 1])
+                b1 = np.int32(padded[yy, xx, 2])
+                w = space_weight[k] * color_weight[abs(l1 - l0) + abs(a1 - a0) + abs(b1 - b0)]
+                sum_l += w * l1
+                sum_a += w * a1
+                sum_b += w * b1
+                wsum += w
+
+            # Lab -> XYZ -> linear RGB -> sRGB without leaving registers
+            lum = sum_l / wsum * (100.0 / 255.0)
+            fy = (lum + 16.0) / 116.0
+            fx = fy + (sum_a / wsum - 128.0) / 500.0
+            fz = fy - (sum_b / wsum - 128.0) / 200.0
+            if lum > 7.9996:
+                yv = fy * fy * fy
+            else:
+                yv = lum / 903.3
+            xv = _lab_f_inv(fx) * _XN
+            zv = _lab_f_inv(fz) * _ZN
+            bgr[y, x, 2] = _linear_to_srgb8(3.240479 * xv - 1.537150 * yv - 0.498535 * zv)
+            bgr[y, x, 1] = _linear_to_srgb8(-0.969256 * xv + 1.875991 * yv + 0.041556 * zv)
+            bgr[y, x, 0] = _linear_to_srgb8(0.055648 * xv - 0.204043 * yv + 1.057311 * zv)
+    return bgr
+
+
+def _bilateral_tables(d: int, sigma_color: float, sigma_space: float) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+    """Gaussian spatial/range weights laid out like cv2.bilateralFilter"""
+    radius = d // 2
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    dist2 = (dy * dy + dx * dx).ravel()
+    # Circular window, as OpenCV does
+    inside = np.sqrt(dist2) <= radius
+    offsets = np.stack([dy.ravel()[inside], dx.ravel()[inside]], axis=1).astype(np.int64)
+    space_weight = np.exp(dist2[inside] * (-0.5 / (sigma_space * sigma_space))).astype(np.float32)
+    color_dist = np.arange(256 * 3, dtype=np.float32)
+    color_weight = np.exp(color_dist * color_dist * np.float32(-0.5 / (sigma_color * sigma_color))).astype(np.float32)
+    return radius, offsets, space_weight, color_weight
+
+
+def enhance_fused(bgr: np.ndarray, clip_limit: float = 2.0, tile_grid_size: Tuple[int, int] = (8, 8),
+                  d: int = 5, sigma_color: float = 75.0, sigma_space: float = 75.0) -> np.ndarray:
+    """CLAHE on L plus bilateral denoising in three parallel passes
+
+    Replaces the cvtColor/split/CLAHE/merge/cvtColor/bilateralFilter chain:
+    one pass converts to Lab, one blends the tile LUTs into L in place, and
+    one filters in Lab space and writes BGR directly, so the only
+    intermediates are the Lab buffer and its border-padded copy.
+    """
+    lab = _bgr_to_lab(np.ascontiguousarray(bgr), _SRGB_TO_LINEAR)
+    apply_clahe(lab, clip_limit, tile_grid_size)
+
+    radius, offsets, space_weight, color_weight = _bilateral_tables(d, sigma_color, sigma_space)
+    # Mirror the border once so the filter loop needs no bounds checks
+    padded = np.pad(lab, ((radius, radius), (radius, radius), (0, 0)), mode='reflect')
+    return _bilateral_lab_to_bgr(padded, radius, offsets, space_weight, color_weight)
@@ -1,28 +1,147 @@
 import cv2
 import numpy as np
-from PIL import Image
-import io
 import base64
-from typing import List, Tuple
+import math
+import os
+import threading
+from typing import List, Optional, Tuple
 import logging
 
+try:
+    from fused_enhance import enhance_fused
+    from numba import set_num_threads as set_numba_threads
+except ImportError:  # numba is optional
+    enhance_fused = None
+    set_numba_threads = None
+
 logger = logging.getLogger(__name__)
 
+
+def _cuda_device_available() -> bool:
+    """Check whether OpenCV was built with CUDA and a device is present"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+# The stock opencv-python wheels ship without CUDA, in which case the CPU path is used
+CUDA_AVAILABLE = _cuda_device_available()
+
+
+def configure_worker(gpu_slots) -> None:
+    """Process pool initializer: single-threaded OpenCV and Numba, CUDA only with a free GPU slot
+    
+    The pool already runs one worker per core, so per-worker thread pools would
+    only oversubscribe the CPU. Every worker using CUDA holds its own context,
+    so a worker that finds gpu_slots exhausted stays on the CPU path.
+    """
+    global CUDA_AVAILABLE
+    cv2.setNumThreads(1)
+    if set_numba_threads is not None:
+        set_numba_threads(1)
+    # The slot is held for the worker's lifetime; a replaced pool gets fresh slots
+    if CUDA_AVAILABLE and not gpu_slots.acquire(block=False):
+        CUDA_AVAILABLE = False
+
+
+def _fused_enhance_enabled() -> bool:
+    """Whether the opt-in Numba enhancement is on, read per call so a .env loaded after import applies"""
+    return enhance_fused is not None and os.environ.get('FUSED_ENHANCE', 'false').lower() == 'true'
+
+
+# Leading signature bytes of the upload formats we accept
+JPEG_MAGIC = b'\xff\xd8\xff'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+
+# Encoder parameters per output format. PNG keeps OpenCV's defaults, which measured
+# faster and smaller on photos than forcing IMWRITE_PNG_STRATEGY_FILTERED.
+ENCODE_PARAMS = {
+    'png': {},
+    'jpg': {cv2.IMWRITE_JPEG_QUALITY: 90, cv2.IMWRITE_JPEG_OPTIMIZE: 1},
+}
+MEDIA_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+}
+
+# Longest edge of the corrected image, larger results are scaled down during the warp
+MAX_OUTPUT_EDGE = 2048
+
+# Bilateral denoising cost grows with the square of the neighbourhood diameter; 5 is
+# about 6x cheaper than 9 with nearly the same noise reduction at sigma 75
+BILATERAL_DIAMETER = 5
+
+# CLAHE objects keep internal state, so each worker thread gets its own instance
+_thread_local = threading.local()
+
+
+def _get_clahe():
+    """Return this thread's CLAHE instance, creating it on first use"""
+    clahe = getattr(_thread_local, 'clahe', None)
+    if clahe is None:
+        clahe = _thread_local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe
+
+
+def _get_cuda_clahe():
+    """Return this thread's CUDA CLAHE instance, creating it on first use"""
+    clahe = getattr(_thread_local, 'cuda_clahe', None)
+    if clahe is None:
+        clahe = _thread_local.cuda_clahe = cv2.cuda.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return clahe
+
+
+def _get_buffer(name: str, shape: Tuple[int, ...]) -> np.ndarray:
+    """Return this thread's scratch uint8 buffer for name, reallocated only when the shape changes
+    
+    The contents are overwritten by the next call on the same thread, so a
+    buffer must never be returned to callers.
+    """
+    buffers = getattr(_thread_local, 'buffers', None)
+    if buffers is None:
+        buffers = _thread_local.buffers = {}
+    buffer = buffers.get(name)
+    if buffer is None or buffer.shape != shape:
+        buffer = buffers[name] = np.empty(shape, dtype=np.uint8)
+    return buffer
+
+
+def _get_gpu_buffer(name: str, rows: int, cols: int, mat_type: int):
+    """Return this thread's device buffer for name, reallocated only when the size or type changes"""
+    buffers = getattr(_thread_local, 'gpu_buffers', None)
+    if buffers is None:
+        buffers = _thread_local.gpu_buffers = {}
+    buffer = buffers.get(name)
+    if buffer is None or buffer.size() != (cols, rows) or buffer.type() != mat_type:
+        buffer = buffers[name] = cv2.cuda_GpuMat(rows, cols, mat_type)
+    return buffer
+
+
+class ImageDecodeError(ValueError):
+    """Raised when uploaded bytes are not an image OpenCV can decode"""
+
+
 class ImageProcessor:
     """Handles image distortion correction using OpenCV perspective transformation"""
     
     @staticmethod
     def validate_image(image_data: bytes) -> bool:
-        """Validate if the uploaded data is a valid image"""
-        try:
-            image = Image.open(io.BytesIO(image_data))
-            # Check if it's a valid image format
-            if image.format not in ['JPEG', 'PNG']:
-                return False
-            return True
-        except Exception as e:
-            logger.error(f"Image validation failed: {e}")
-            return False
+        """Check the file signature of the uploaded data without decoding it
+        
+        Corrupt bodies with a valid signature are caught later, when
+        cv2.imdecode returns None in load_image_from_bytes.
+        """
+        return ImageProcessor.detect_format(image_data) is not None
+    
+    @staticmethod
+    def detect_format(image_data: bytes) -> Optional[str]:
+        """Return 'jpg' or 'png' from the file signature, None for anything else"""
+        if image_data.startswith(JPEG_MAGIC):
+            return 'jpg'
+        if image_data.startswith(PNG_MAGIC):
+            return 'png'
+        return None
     
     @staticmethod
     def load_image_from_bytes(image_data: bytes) -> np.ndarray:
@@ -30,91 +149,106 @@ class ImageProcessor:
         try:
             # Convert bytes to numpy array
             nparr = np.frombuffer(image_data, np.uint8)
-            # Decode image
+            # Decode image. The Python bindings do not expose the C++ imdecode(buf, flags, dst)
+            # overload, so the output Mat cannot be recycled between same-sized uploads here.
+            # The opencv-python wheels build their JPEG codec from libjpeg-turbo, so this is
+            # already its SIMD decoder and a separate TurboJPEG binding would not be faster.
             image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             if image is None:
-                raise ValueError("Failed to decode image")
+                raise ImageDecodeError("Failed to decode image")
             return image
         except Exception as e:
             logger.error(f"Failed to load image from bytes: {e}")
             raise
     
     @staticmethod
-    def save_image_to_bytes(image: np.ndarray, format: str = 'PNG') -> bytes:
-        """Convert OpenCV image to bytes"""
+    def save_image_to_bytes(image: np.ndarray, format: str = 'PNG', quality: Optional[int] = None) -> bytes:
+        """Convert OpenCV image to bytes, quality only applies to JPEG"""
         try:
             # Encode image to bytes
-            _, buffer = cv2.imencode(f'.{format.lower()}', image)
+            format = format.lower()
+            flags = dict(ENCODE_PARAMS.get(format, {}))
+            if format == 'jpg' and quality is not None:
+                flags[cv2.IMWRITE_JPEG_QUALITY] = quality
+            # imencode takes the flags as a flat [flag, value, ...] list
+            params = [v for flag_value in flags.items() for v in flag_value]
+            _, buffer = cv2.imencode(f'.{format}', image, params)
             return buffer.tobytes()
         except Exception as e:
             logger.error(f"Failed to save image to bytes: {e}")
             raise
     
     @staticmethod
-    def normalize_corner_points(corner_points: List[dict], image_shape: Tuple[int, int]) -> List[Tuple[float, float]]:
-        """Normalize corner points from frontend coordinates to image coordinates"""
+    def normalize_corner_points(corner_points: List[dict], image_shape: Tuple[int, int]) -> np.ndarray:
+        """Normalize corner points from frontend coordinates to a (4, 2) float32 array of image coordinates"""
         try:
             height, width = image_shape[:2]
             
-            # Convert frontend coordinates (which may be scaled) to actual image coordinates
-            normalized_points = []
-            for point in corner_points:
-                # Assuming frontend coordinates are already in image space
-                # If frontend uses scaled coordinates, we'd need to scale them back
-                x = max(0, min(point['x'], width - 1))
-                y = max(0, min(point['y'], height - 1))
-                normalized_points.append((x, y))
+            # Frontend coordinates are already in image space, so just clamp them to the image bounds
+            points = np.fromiter(
+                (v for point in corner_points for v in (point['x'], point['y'])),
+                dtype=np.float32,
+                count=2 * len(corner_points)
+            ).reshape(-1, 2)
+            np.clip(points, (0, 0), (width - 1, height - 1), out=points)
             
-            return normalized_points
+            return points
         except Exception as e:
             logger.error(f"Failed to normalize corner points: {e}")
             raise
     
+    @staticmethod
+    def compute_perspective_transform(image_shape: Tuple[int, int], corner_points: List[dict]) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Compute the perspective matrix and output size for the selected corners"""
+        if len(corner_points) != 4:
+            raise ValueError("Exactly 4 corner points required")
+        
+        # Normalize corner points, already a float32 array ready for OpenCV
+        src_points = ImageProcessor.normalize_corner_points(corner_points, image_shape)
+        
+        # Calculate the width and height of the corrected image
+        # Use the maximum dimensions to preserve aspect ratio
+        # Plain floats and math.hypot are much cheaper than np.linalg.norm on 2-vectors
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = src_points.tolist()
+        rect_width = max(
+            math.hypot(x1 - x0, y1 - y0),  # top edge
+            math.hypot(x2 - x3, y2 - y3)   # bottom edge
+        )
+        rect_height = max(
+            math.hypot(x3 - x0, y3 - y0),  # left edge
+            math.hypot(x2 - x1, y2 - y1)   # right edge
+        )
+        
+        # Cap the long edge; every later stage (enhance, encode) scales with pixel count
+        scale = min(1.0, MAX_OUTPUT_EDGE / max(rect_width, rect_height, 1.0))
+        rect_width *= scale
+        rect_height *= scale
+        
+        # Define destination points (rectangle)
+        dst_points = np.array([
+            [0, 0],
+            [rect_width, 0],
+            [rect_width, rect_height],
+            [0, rect_height]
+        ], dtype=np.float32)
+        
+        # Get perspective transformation matrix
+        matrix = cv2.getPerspectiveTransform(src_points, dst_points)
+        
+        return matrix, (int(rect_width), int(rect_height))
+    
     @staticmethod
     def apply_perspective_correction(image: np.ndarray, corner_points: List[dict]) -> np.ndarray:
         """Apply perspective transformation to correct image distortion"""
         try:
-            if len(corner_points) != 4:
-                raise ValueError("Exactly 4 corner points required")
-            
             height, width = image.shape[:2]
             
-            # Normalize corner points
-            normalized_points = ImageProcessor.normalize_corner_points(corner_points, image.shape)
-            
-            # Convert to numpy array for OpenCV
-            src_points = np.array(normalized_points, dtype=np.float32)
-            
-            # Calculate the width and height of the corrected image
-            # Use the maximum dimensions to preserve aspect ratio
-            rect_width = max(
-                np.linalg.norm(src_points[1] - src_points[0]),  # top edge
-                np.linalg.norm(src_points[2] - src_points[3])   # bottom edge
-            )
-            rect_height = max(
-                np.linalg.norm(src_points[3] - src_points[0]),  # left edge
-                np.linalg.norm(src_points[2] - src_points[1])   # right edge
-            )
-            
-            # Define destination points (rectangle)
-            dst_points = np.array([
-                [0, 0],
-                [rect_width, 0],
-                [rect_width, rect_height],
-                [0, rect_height]
-            ], dtype=np.float32)
-            
-            # Get perspective transformation matrix
-            matrix = cv2.getPerspectiveTransform(src_points, dst_points)
+            matrix, output_size = ImageProcessor.compute_perspective_transform(image.shape, corner_points)
             
             # Apply perspective transformation
-            corrected_image = cv2.warpPerspective(
-                image, 
-                matrix, 
-                (int(rect_width), int(rect_height))
-            )
+            corrected_image = cv2.warpPerspective(image, matrix, output_size)
             
-            logger.info(f"Applied perspective correction. Original: {width}x{height}, Corrected: {int(rect_width)}x{int(rect_height)}")
+            logger.info(f"Applied perspective correction. Original: {width}x{height}, Corrected: {output_size[0]}x{output_size[1]}")
             
             return corrected_image
             
@@ -126,21 +260,27 @@ class ImageProcessor:
     def enhance_image(image: np.ndarray) -> np.ndarray:
         """Apply basic image enhancement after correction"""
         try:
+            if _fused_enhance_enabled():
+                enhanced = enhance_fused(image, clip_limit=2.0, tile_grid_size=(8, 8), d=BILATERAL_DIAMETER, sigma_color=75, sigma_space=75)
+                logger.info("Applied fused image enhancement")
+                return enhanced
+            
             # Apply basic enhancement
             # 1. Improve contrast
-            lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-            l, a, b = cv2.split(lab)
+            lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=_get_buffer('lab', image.shape))
             
-            # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            l = clahe.apply(l)
+            # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) to L only, no
+            # split/merge of a and b. lab[:, :, 0] is a strided view the binding would copy,
+            # so L goes through a reused contiguous buffer that CLAHE also writes into.
+            l_plane = _get_buffer('l', image.shape[:2])
+            np.copyto(l_plane, lab[:, :, 0])
+            _get_clahe().apply(l_plane, dst=l_plane)
+            lab[:, :, 0] = l_plane
             
-            # Merge channels back
-            lab = cv2.merge([l, a, b])
-            enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+            enhanced = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=_get_buffer('bgr', image.shape))
             
             # 2. Reduce noise
-            enhanced = cv2.bilateralFilter(enhanced, 9, 75, 75)
+            enhanced = cv2.bilateralFilter(enhanced, BILATERAL_DIAMETER, 75, 75)
             
             logger.info("Applied image enhancement")
             return enhanced
@@ -149,29 +289,80 @@ class ImageProcessor:
             logger.warning(f"Image enhancement failed, returning original: {e}")
             return image
     
+    @staticmethod
+    def correct_and_enhance_gpu(image: np.ndarray, corner_points: List[dict]) -> np.ndarray:
+        """Run perspective correction and enhancement on the GPU
+        
+        The image is uploaded once, every stage is queued on a single CUDA stream
+        so the kernels pipeline, and the result is downloaded once at the end.
+        """
+        height, width = image.shape[:2]
+        matrix, output_size = ImageProcessor.compute_perspective_transform(image.shape, corner_points)
+        out_width, out_height = output_size
+        
+        stream = cv2.cuda_Stream()
+        
+        # Device buffers are reused across calls on this thread, so no stage allocates
+        src_gpu = _get_gpu_buffer('src', height, width, cv2.CV_8UC3)
+        warped_gpu = _get_gpu_buffer('warped', out_height, out_width, cv2.CV_8UC3)
+        lab_gpu = _get_gpu_buffer('lab', out_height, out_width, cv2.CV_8UC3)
+        planes_gpu = [_get_gpu_buffer(f'plane{i}', out_height, out_width, cv2.CV_8UC1) for i in range(3)]
+        l_clahe_gpu = _get_gpu_buffer('l_clahe', out_height, out_width, cv2.CV_8UC1)
+        contrast_gpu = _get_gpu_buffer('contrast', out_height, out_width, cv2.CV_8UC3)
+        enhanced_gpu = _get_gpu_buffer('enhanced', out_height, out_width, cv2.CV_8UC3)
+        
+        src_gpu.upload(image, stream)
+        cv2.cuda.warpPerspective(src_gpu, matrix, output_size, dst=warped_gpu, stream=stream)
+        
+        try:
+            # 1. Improve contrast with CLAHE on the L channel
+            cv2.cuda.cvtColor(warped_gpu, cv2.COLOR_BGR2Lab, dst=lab_gpu, stream=stream)
+            cv2.cuda.split(lab_gpu, planes_gpu, stream=stream)
+            _get_cuda_clahe().apply(planes_gpu[0], stream, dst=l_clahe_gpu)
+            cv2.cuda.merge([l_clahe_gpu, planes_gpu[1], planes_gpu[2]], lab_gpu, stream=stream)
+            cv2.cuda.cvtColor(lab_gpu, cv2.COLOR_Lab2BGR, dst=contrast_gpu, stream=stream)
+            
+            # 2. Reduce noise
+            cv2.cuda.bilateralFilter(contrast_gpu, BILATERAL_DIAMETER, 75, 75, dst=enhanced_gpu, stream=stream)
+            
+            corrected_image = enhanced_gpu.download(stream)
+            stream.waitForCompletion()
+        except Exception as e:
+            # Same fallback as enhance_image: the warp is kept, only the enhancement is skipped
+            logger.error(f"GPU image enhancement failed: {e}")
+            corrected_image = warped_gpu.download()
+        
+        logger.info(f"Applied GPU correction and enhancement. Original: {width}x{height}, Corrected: {out_width}x{out_height}")
+        
+        return corrected_image
+    
     @classmethod
-    def process_image_correction(cls, image_data: bytes, corner_points: List[dict]) -> bytes:
-        """Main method to process image distortion correction"""
+    def process_image_correction(cls, image_data: bytes, corner_points: List[dict]) -> np.ndarray:
+        """Main method to process image distortion correction
+        
+        Returns the corrected BGR image; encoding is left to whoever serves it.
+        """
         try:
             # Validate image
             if not cls.validate_image(image_data):
-                raise ValueError("Invalid image format")
+                raise ImageDecodeError("Invalid image format")
             
-            # Load image
+            # Load image, this is the only full decode of the upload
             image = cls.load_image_from_bytes(image_data)
             logger.info(f"Loaded image with shape: {image.shape}")
             
-            # Apply perspective correction
-            corrected_image = cls.apply_perspective_correction(image, corner_points)
-            
-            # Apply enhancement
-            enhanced_image = cls.enhance_image(corrected_image)
-            
-            # Convert back to bytes
-            result_bytes = cls.save_image_to_bytes(enhanced_image, 'PNG')
+            if CUDA_AVAILABLE:
+                # Keep the image in device memory for the whole pipeline
+                enhanced_image = cls.correct_and_enhance_gpu(image, corner_points)
+            else:
+                # Apply perspective correction
+                corrected_image = cls.apply_perspective_correction(image, corner_points)
+                
+                # Apply enhancement
+                enhanced_image = cls.enhance_image(corrected_image)
             
             logger.info("Image processing completed successfully")
-            return result_bytes
+            return enhanced_image
             
         except Exception as e:
             logger.error(f"Image processing failed: {e}")
@@ -1,8 +1,28 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
+import os
+import time
 import uuid
 from datetime import datetime
 
+
+def uuid7_hex() -> str:
+    """Generate a time-ordered UUIDv7 as 32 hex characters
+    
+    The millisecond timestamp prefix makes new ids sort after older ones, so
+    index inserts append instead of landing at random B-tree pages.
+    """
+    unix_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), 'big')
+    value = (
+        (unix_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76                          # version
+        | (rand >> 62 & 0xFFF) << 64         # rand_a
+        | 0b10 << 62                         # RFC 4122 variant
+        | rand & 0x3FFF_FFFF_FFFF_FFFF       # rand_b
+    )
+    return uuid.UUID(int=value).hex
+
 class CornerPoint(BaseModel):
     x: float
     y: float
@@ -22,7 +42,7 @@ class ProcessImageResponse(BaseModel):
     message: str
 
 class ImageRecord(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=uuid7_hex)
     filename: str
     original_path: str
     processed_path: Optional[str] = None
@@ -1,21 +1,25 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Response
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Response, Query
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
 import os
 import logging
 import time
-import io
 from pathlib import Path
-from typing import Dict
+from typing import Literal, Tuple
+from cachetools import LRUCache
 from models import (
     ImageUploadResponse, 
     ProcessImageRequest, 
     ProcessImageResponse, 
     ImageRecord
 )
-from image_processor import ImageProcessor
+from image_processor import ImageProcessor, ImageDecodeError, MEDIA_TYPES, configure_worker
+from storage import ImageStore, content_etag
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -31,9 +35,37 @@ app = FastAPI(title="Image Distortion Corrector API")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# In-memory storage for processed images (in production, use file storage or cloud storage)
-image_storage: Dict[str, bytes] = {}
-processed_storage: Dict[str, bytes] = {}
+# Upload limits
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+SIGNATURE_BYTES = 8
+
+# Image bytes live on disk with a bounded in-memory LRU cache in front
+CACHE_DIR = ROOT_DIR / 'cache'
+image_storage = ImageStore(CACHE_DIR / 'original')
+processed_storage = ImageStore(CACHE_DIR / 'processed')
+
+# Processed images are stored decoded and encoded on first request, per format/quality
+encoded_cache = LRUCache(maxsize=64 * 1024 * 1024, getsizeof=lambda entry: len(entry[0]))
+
+# Upper bound on a single correction; a request waiting longer gets a 504
+PROCESS_TIMEOUT_SECONDS = 60
+
+# Workers allowed to run on the GPU, each holds its own CUDA context
+GPU_WORKERS = 1
+
+def create_process_pool() -> ProcessPoolExecutor:
+    # Spawned (not forked) so workers don't inherit Mongo client threads or a CUDA context.
+    # One single-threaded worker per core; OpenCV threading inside them would oversubscribe.
+    mp_context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=mp_context,
+        initializer=configure_worker,
+        initargs=(mp_context.BoundedSemaphore(GPU_WORKERS),)
+    )
+
+# OpenCV work runs in worker processes so it never blocks the event loop
+process_pool = create_process_pool()
 
 # Configure logging
 logging.basicConfig(
@@ -42,6 +74,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def run_in_process_pool(func, *args):
+    """Run func in the worker pool, replacing the pool if a worker process died"""
+    global process_pool
+    pool = process_pool
+    try:
+        return await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(pool, func, *args),
+            timeout=PROCESS_TIMEOUT_SECONDS
+        )
+    except BrokenProcessPool:
+        # A dead worker (e.g. OOM-killed) breaks the pool for every later submit too.
+        # Only the first request to notice replaces it.
+        if process_pool is pool:
+            logger.error("Worker process died, recreating the process pool")
+            process_pool = create_process_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
 @api_router.get("/")
 async def root():
     return {"message": "Image Distortion Corrector API v1.0"}
@@ -57,34 +107,40 @@ async def upload_image(file: UploadFile = File(...)):
                 detail="Invalid file type. Only JPEG and PNG images are supported."
             )
         
-        # Read file data
-        file_data = await file.read()
-        
-        # Validate file size (10MB limit)
-        if len(file_data) > 10 * 1024 * 1024:
+        # Validate file size (10MB limit) before reading any of the body
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
             raise HTTPException(
-                status_code=400,
+                status_code=413,
                 detail="File size too large. Maximum size is 10MB."
             )
         
-        # Validate image format using our processor
-        if not ImageProcessor.validate_image(file_data):
+        # Validate image format from the file signature alone
+        if not ImageProcessor.validate_image(await file.read(SIGNATURE_BYTES)):
             raise HTTPException(
                 status_code=400,
                 detail="Invalid image format or corrupted file."
             )
         
+        # Read file data, never more than one byte past the limit
+        await file.seek(0)
+        file_data = await file.read(MAX_UPLOAD_BYTES + 1)
+        if len(file_data) > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail="File size too large. Maximum size is 10MB."
+            )
+        
         # Create image record
         image_record = ImageRecord(
             filename=file.filename,
-            original_path="memory",  # We're storing in memory for simplicity
+            original_path="cache",
         )
         
-        # Store image data in memory
-        image_storage[image_record.id] = file_data
+        # Store image data
+        await image_storage.put(image_record.id, file_data)
         
         # Save record to database
-        await db.images.insert_one(image_record.dict())
+        await db.images.insert_one(image_record.model_dump(exclude_none=True))
         
         logger.info(f"Image uploaded successfully: {image_record.id}")
         
@@ -105,7 +161,8 @@ async def process_image(request: ProcessImageRequest):
     """Process image with perspective correction"""
     try:
         # Check if image exists
-        if request.image_id not in image_storage:
+        original_data = await image_storage.get(request.image_id)
+        if original_data is None:
             raise HTTPException(status_code=404, detail="Image not found")
         
         # Validate corner points
@@ -117,20 +174,18 @@ async def process_image(request: ProcessImageRequest):
         
         start_time = time.time()
         
-        # Get original image data
-        original_data = image_storage[request.image_id]
-        
         # Convert corner points to dict format expected by processor
-        corner_points = [point.dict() for point in request.corner_points]
+        corner_points = [point.model_dump() for point in request.corner_points]
         
-        # Process image
-        processed_data = ImageProcessor.process_image_correction(
-            original_data, 
+        # Process image in the worker pool
+        processed_image = await run_in_process_pool(
+            ImageProcessor.process_image_correction,
+            original_data,
             corner_points
         )
         
         # Store processed image
-        processed_storage[request.image_id] = processed_data
+        await processed_storage.put_array(request.image_id, processed_image)
         
         # Update database record
         processing_time = time.time() - start_time
@@ -138,7 +193,7 @@ async def process_image(request: ProcessImageRequest):
             {"id": request.image_id},
             {
                 "$set": {
-                    "processed_path": "memory",
+                    "processed_path": "cache",
                     "corner_points": corner_points,
                     "processing_time": processing_time
                 }
@@ -155,52 +210,105 @@ async def process_image(request: ProcessImageRequest):
         
     except HTTPException:
         raise
+    except ImageDecodeError as e:
+        # The signature looked right at upload but the body itself is corrupt
+        logger.warning(f"Image {request.image_id} could not be decoded: {e}")
+        raise HTTPException(status_code=400, detail="Invalid image format or corrupted file.")
+    except asyncio.TimeoutError:
+        logger.error(f"Image processing timed out after {PROCESS_TIMEOUT_SECONDS}s: {request.image_id}")
+        raise HTTPException(status_code=504, detail="Image processing timed out")
+    except BrokenProcessPool:
+        raise HTTPException(status_code=503, detail="Image processing worker crashed, please retry")
     except Exception as e:
         logger.error(f"Image processing failed: {e}")
         raise HTTPException(status_code=500, detail=f"Image processing failed: {str(e)}")
 
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the request's If-None-Match header against etag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
 @api_router.get("/images/{image_id}/original")
-async def get_original_image(image_id: str):
+async def get_original_image(image_id: str, request: Request):
     """Serve original uploaded image"""
-    if image_id not in image_storage:
+    stored = await image_storage.get_with_etag(image_id)
+    if stored is None:
         raise HTTPException(status_code=404, detail="Image not found")
     
-    image_data = image_storage[image_id]
-    return StreamingResponse(
-        io.BytesIO(image_data),
-        media_type="image/png",
-        headers={"Cache-Control": "max-age=3600"}
+    image_data, etag = stored
+    # Originals never change under their id, so browsers may keep them indefinitely
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(
+        content=image_data,
+        media_type=MEDIA_TYPES[ImageProcessor.detect_format(image_data)],
+        headers=headers
     )
 
+async def encode_processed_image(image_id: str, fmt: str, q: int) -> Tuple[bytes, str]:
+    """Encode the stored processed image with its ETag, reusing earlier encodes of the same version"""
+    quality = q if fmt == 'jpg' else None
+    version = await processed_storage.version(image_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Processed image not found")
+    
+    encoded = encoded_cache.get((image_id, version, fmt, quality))
+    if encoded is None:
+        stored = await processed_storage.get_array_with_version(image_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Processed image not found")
+        # Key the encode by the version actually decoded, in case it changed since the check
+        image, version = stored
+        # imencode releases the GIL, so a thread is enough here
+        image_data = await asyncio.to_thread(ImageProcessor.save_image_to_bytes, image, fmt, q)
+        encoded = encoded_cache[(image_id, version, fmt, quality)] = (image_data, content_etag(image_data))
+    return encoded
+
 @api_router.get("/images/{image_id}/processed")
-async def get_processed_image(image_id: str):
+async def get_processed_image(
+    image_id: str,
+    request: Request,
+    fmt: Literal["png", "jpg"] = "png",
+    q: int = Query(90, ge=1, le=100)
+):
     """Serve processed/corrected image"""
-    if image_id not in processed_storage:
-        raise HTTPException(status_code=404, detail="Processed image not found")
+    image_data, etag = await encode_processed_image(image_id, fmt, q)
     
-    image_data = processed_storage[image_id]
-    return StreamingResponse(
-        io.BytesIO(image_data),
-        media_type="image/png",
-        headers={"Cache-Control": "max-age=3600"}
+    # Re-processing replaces the image under the same URL, so always revalidate
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(
+        content=image_data,
+        media_type=MEDIA_TYPES[fmt],
+        headers=headers
     )
 
 @api_router.get("/images/{image_id}/download")
-async def download_processed_image(image_id: str):
+async def download_processed_image(
+    image_id: str,
+    fmt: Literal["png", "jpg"] = "png",
+    q: int = Query(90, ge=1, le=100)
+):
     """Download processed image with proper headers"""
-    if image_id not in processed_storage:
-        raise HTTPException(status_code=404, detail="Processed image not found")
+    image_data, _ = await encode_processed_image(image_id, fmt, q)
     
     # Get image record for filename
     image_record = await db.images.find_one({"id": image_id})
     if not image_record:
         raise HTTPException(status_code=404, detail="Image record not found")
     
-    image_data = processed_storage[image_id]
-    filename = f"corrected_{image_record['filename'].split('.')[0]}.png"
+    filename = f"corrected_{image_record['filename'].split('.')[0]}.{fmt}"
     
-    return StreamingResponse(
-        io.BytesIO(image_data),
+    return Response(
+        content=image_data,
         media_type="application/octet-stream",
         headers={
             "Content-Disposition": f"attachment; filename={filename}",
@@ -221,7 +329,7 @@ async def get_image_info(image_id: str):
         "upload_time": image_record["upload_time"],
         "processing_time": image_record.get("processing_time"),
         "corner_points": image_record.get("corner_points"),
-        "is_processed": image_id in processed_storage
+        "is_processed": await processed_storage.version(image_id) is not None
     }
 
 # Health check endpoint
@@ -245,12 +353,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def create_db_indexes():
+    # /info and /download look records up by our own id, not Mongo's _id
+    await db.images.create_index("id", unique=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
-    # Clear memory storage
+    process_pool.shutdown(cancel_futures=True)
+    # Remove cached image files
     image_storage.clear()
     processed_storage.clear()
+    encoded_cache.clear()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,158 @@
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple
+from cachetools import LRUCache
+
+# Image ids end up in file names, so only accept plain id characters
+_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Every stored file starts with a digest of its content, used as its version and ETag
+_DIGEST_SIZE = 16
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=_DIGEST_SIZE).digest()
+
+
+def content_etag(data: bytes) -> str:
+    """Strong, quoted HTTP ETag derived from the content itself"""
+    return f'"{_digest(data).hex()}"'
+
+
+class ImageStore:
+    """Disk-backed image store with a size-bounded in-memory LRU cache in front
+
+    Cached entries are tagged with the content digest stored at the head of
+    the file, so a rewrite by another worker process is picked up instead of
+    serving stale bytes, however close together the writes land.
+    """
+
+    def __init__(self, directory: Path, max_cache_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._cache = LRUCache(maxsize=max_cache_bytes, getsizeof=lambda entry: len(entry[1]))
+
+    def _path(self, key: str) -> Optional[Path]:
+        if not _KEY_PATTERN.match(key):
+            return None
+        return self.directory / f"{key}.bin"
+
+    def _write(self, path: Path, data: bytes) -> bytes:
+        digest = _digest(data)
+        # Write to a unique temp file first so readers never see a partial image
+        # and concurrent writers of the same key never share a temp path
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(digest)
+                tmp_file.write(data)
+            os.replace(tmp_name, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_name)
+            raise
+        return digest
+
+    @staticmethod
+    def _read_digest(path: Path) -> Optional[bytes]:
+        try:
+            with open(path, 'rb') as f:
+                return f.read(_DIGEST_SIZE)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _read(path: Path, cached_digest: Optional[bytes]) -> Optional[Tuple[bytes, Optional[bytes]]]:
+        # The data is only read when it differs from what the cache already holds
+        try:
+            with open(path, 'rb') as f:
+                digest = f.read(_DIGEST_SIZE)
+                if digest == cached_digest:
+                    return digest, None
+                return digest, f.read()
+        except FileNotFoundError:
+            return None
+
+    def _remember(self, key: str, digest: bytes, data: bytes) -> None:
+        # Entries larger than the whole cache are only kept on disk
+        if len(data) <= self._cache.maxsize:
+            self._cache[key] = (digest, data)
+
+    async def version(self, key: str) -> Optional[str]:
+        """Return a token that changes whenever key's content changes, None if it is missing"""
+        path = self._path(key)
+        if path is None:
+            return None
+        digest = await asyncio.to_thread(self._read_digest, path)
+        return None if digest is None else digest.hex()
+
+    async def put(self, key: str, data: bytes) -> None:
+        """Persist data under key and keep it hot in the cache"""
+        path = self._path(key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {key}")
+        digest = await asyncio.to_thread(self._write, path, data)
+        self._remember(key, digest, data)
+
+    async def get_with_version(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return the data stored under key with its version, or None if there is none"""
+        path = self._path(key)
+        if path is None:
+            return None
+        entry = self._cache.get(key)
+        loaded = await asyncio.to_thread(self._read, path, entry[0] if entry is not None else None)
+        if loaded is None:
+            self._cache.pop(key, None)
+            return None
+        digest, data = loaded
+        if data is None:
+            data = entry[1]
+        else:
+            self._remember(key, digest, data)
+        return data, digest.hex()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the data stored under key, or None if there is none"""
+        stored = await self.get_with_version(key)
+        return None if stored is None else stored[0]
+
+    async def get_with_etag(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return the data stored under key with its ETag, which is the stored digest"""
+        stored = await self.get_with_version(key)
+        if stored is None:
+            return None
+        data, version = stored
+        return data, f'"{version}"'
+
+    async def put_array(self, key: str, array: np.ndarray) -> None:
+        """Persist a decoded image as raw .npy data, no compression involved"""
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        await self.put(key, buffer.getvalue())
+
+    async def get_array_with_version(self, key: str) -> Optional[Tuple[np.ndarray, str]]:
+        """Return the array stored under key with its version, or None if there is none"""
+        stored = await self.get_with_version(key)
+        if stored is None:
+            return None
+        data, version = stored
+        return np.load(io.BytesIO(data), allow_pickle=False), version
+
+    async def get_array(self, key: str) -> Optional[np.ndarray]:
+        """Return the array stored under key, or None if there is none"""
+        stored = await self.get_array_with_version(key)
+        return None if stored is None else stored[0]
+
+    def clear(self) -> None:
+        """Drop the cache and remove every stored file, leaving an empty directory"""
+        self._cache.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("motor")
+pytest.importorskip("httpx")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# The routes under test never reach Mongo; the client only has to be constructible
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+import server  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from storage import ImageStore  # noqa: E402
+
+JPEG_BODY = b"\xff\xd8\xff" + b"not decoded by these routes"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "image_storage", ImageStore(tmp_path / "original"))
+    monkeypatch.setattr(server, "processed_storage", ImageStore(tmp_path / "processed"))
+    server.encoded_cache.clear()
+    # No context manager, so startup/shutdown (Mongo index, pool shutdown) never run
+    yield TestClient(server.app)
+    server.encoded_cache.clear()
+
+
+def put_original(data: bytes = JPEG_BODY) -> None:
+    asyncio.run(server.image_storage.put("img", data))
+
+
+def put_processed(value: int) -> None:
+    asyncio.run(server.processed_storage.put_array("img", np.full((8, 8, 3), value, dtype=np.uint8)))
+
+
+def test_original_sends_etag_and_immutable_caching(client):
+    put_original()
+
+    response = client.get("/api/images/img/original")
+
+    assert response.status_code == 200
+    assert response.content == JPEG_BODY
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"].startswith('"')
+    assert "immutable" in response.headers["cache-control"]
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}",
+    "W/{etag}",
+    '"other", {etag}',
+    '"other",W/{etag} , "more"',
+    "*",
+    " * ",
+])
+def test_original_matching_if_none_match_returns_304(client, if_none_match):
+    put_original()
+    etag = client.get("/api/images/img/original").headers["etag"]
+
+    response = client.get("/api/images/img/original",
+                          headers={"If-None-Match": if_none_match.format(etag=etag)})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.parametrize("if_none_match", ['"other"', 'W/"other", "another"', ""])
+def test_original_other_if_none_match_returns_200(client, if_none_match):
+    put_original()
+
+    response = client.get("/api/images/img/original", headers={"If-None-Match": if_none_match})
+
+    assert response.status_code == 200
+    assert response.content == JPEG_BODY
+
+
+def test_missing_images_return_404(client):
+    assert client.get("/api/images/img/original").status_code == 404
+    assert client.get("/api/images/img/original", headers={"If-None-Match": "*"}).status_code == 404
+    assert client.get("/api/images/img/processed").status_code == 404
+
+
+def test_processed_revalidates_with_etag(client):
+    put_processed(10)
+
+    response = client.get("/api/images/img/processed")
+    etag = response.headers["etag"]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["cache-control"] == "no-cache"
+    assert client.get("/api/images/img/processed", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/images/img/processed", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+
+def test_processed_etag_differs_per_format(client):
+    put_processed(10)
+
+    png_etag = client.get("/api/images/img/processed").headers["etag"]
+    jpg = client.get("/api/images/img/processed", params={"fmt": "jpg", "q": 80})
+
+    assert jpg.headers["content-type"] == "image/jpeg"
+    assert jpg.headers["etag"] != png_etag
+    response = client.get("/api/images/img/processed", params={"fmt": "jpg", "q": 80},
+                          headers={"If-None-Match": png_etag})
+    assert response.status_code == 200
+
+
+def test_reprocessing_changes_the_processed_etag(client):
+    put_processed(10)
+    old_etag = client.get("/api/images/img/processed").headers["etag"]
+
+    # Re-process right away, as a second /process-image call would
+    put_processed(200)
+
+    response = client.get("/api/images/img/processed", headers={"If-None-Match": old_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != old_etag
+    assert client.get("/api/images/img/processed",
+                      headers={"If-None-Match": response.headers["etag"]}).status_code == 304
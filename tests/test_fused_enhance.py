@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("numba")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fused_enhance import apply_clahe, enhance_fused  # noqa: E402
+
+SHAPES = [
+    (1, 50), (50, 1), (1, 1), (5, 7), (37, 91), (480, 640), (603, 811),
+    # Only one side divides by the grid, so OpenCV pads the other by a whole grid
+    (64, 63), (480, 641), (481, 640), (2048, 1537), (1, 8), (8, 1),
+]
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_apply_clahe_matches_opencv(shape):
+    rng = np.random.default_rng(0)
+    lab = rng.integers(0, 256, size=shape + (3,), dtype=np.uint8)
+    expected = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(np.ascontiguousarray(lab[:, :, 0]))
+
+    apply_clahe(lab, 2.0, (8, 8))
+
+    np.testing.assert_array_equal(lab[:, :, 0], expected)
+
+
+@pytest.mark.parametrize("shape", [(1, 50), (50, 1), (1, 1)])
+def test_enhance_fused_handles_single_row_or_column(shape):
+    bgr = np.random.default_rng(0).integers(0, 256, size=shape + (3,), dtype=np.uint8)
+
+    result = enhance_fused(bgr, d=5)
+
+    assert result.shape == bgr.shape
+    assert result.dtype == np.uint8
@@ -0,0 +1,114 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cachetools")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from storage import ImageStore, content_etag  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_put_then_get_round_trips(tmp_path):
+    store = ImageStore(tmp_path / "store")
+
+    run(store.put("abc", b"image bytes"))
+
+    assert run(store.get("abc")) == b"image bytes"
+    assert run(store.version("abc")) is not None
+
+
+def test_missing_key_returns_none(tmp_path):
+    store = ImageStore(tmp_path / "store")
+
+    assert run(store.get("missing")) is None
+    assert run(store.version("missing")) is None
+    assert run(store.get_with_etag("missing")) is None
+
+
+def test_data_survives_a_fresh_store(tmp_path):
+    run(ImageStore(tmp_path / "store").put("abc", b"on disk"))
+
+    assert run(ImageStore(tmp_path / "store").get("abc")) == b"on disk"
+
+
+def test_rewrite_by_another_store_invalidates_cached_entry(tmp_path):
+    reader = ImageStore(tmp_path / "store")
+    writer = ImageStore(tmp_path / "store")
+    run(reader.put("abc", b"first"))
+    old_version = run(reader.version("abc"))
+
+    # Back to back, well within one mtime tick
+    run(writer.put("abc", b"second"))
+
+    assert run(reader.get("abc")) == b"second"
+    assert run(reader.version("abc")) != old_version
+
+
+def test_same_content_keeps_its_version(tmp_path):
+    store = ImageStore(tmp_path / "store")
+    run(store.put("abc", b"same"))
+    version = run(store.version("abc"))
+
+    run(store.put("abc", b"same"))
+
+    assert run(store.version("abc")) == version
+
+
+def test_get_with_etag_matches_content_etag(tmp_path):
+    store = ImageStore(tmp_path / "store")
+    run(store.put("abc", b"tagged"))
+
+    assert run(store.get_with_etag("abc")) == (b"tagged", content_etag(b"tagged"))
+    run(store.put("abc", b"retagged"))
+    assert run(store.get_with_etag("abc")) == (b"retagged", content_etag(b"retagged"))
+
+
+def test_entries_larger_than_the_cache_are_served_from_disk(tmp_path):
+    store = ImageStore(tmp_path / "store", max_cache_bytes=4)
+    run(store.put("big", b"larger than four bytes"))
+
+    assert run(store.get("big")) == b"larger than four bytes"
+    assert run(store.get_with_etag("big"))[1] == content_etag(b"larger than four bytes")
+
+
+@pytest.mark.parametrize("key", ["../escape", "a/b", "", "dot.dot", "with space"])
+def test_invalid_keys_are_rejected(tmp_path, key):
+    store = ImageStore(tmp_path / "store")
+
+    with pytest.raises(ValueError):
+        run(store.put(key, b"data"))
+    assert run(store.get(key)) is None
+    assert run(store.version(key)) is None
+    assert not (tmp_path / "escape.bin").exists()
+
+
+def test_array_round_trip(tmp_path):
+    store = ImageStore(tmp_path / "store")
+    image = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+
+    run(store.put_array("abc", image))
+
+    loaded = run(store.get_array("abc"))
+    np.testing.assert_array_equal(loaded, image)
+    assert loaded.dtype == np.uint8
+    _, version = run(store.get_array_with_version("abc"))
+    assert version == run(store.version("abc"))
+
+
+def test_clear_empties_the_store_and_keeps_it_usable(tmp_path):
+    store = ImageStore(tmp_path / "store")
+    run(store.put("abc", b"data"))
+
+    store.clear()
+
+    assert run(store.get("abc")) is None
+    run(store.put("abc", b"again"))
+    assert run(store.get("abc")) == b"again"